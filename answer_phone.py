@@ -1,58 +1,208 @@
+import os
+import re
+import threading
+from collections import OrderedDict
 from flask import Flask, request
+from twilio.rest import Client
 from twilio.twiml.voice_response import VoiceResponse, Gather, Dial
+from dotenv import load_dotenv
+from gather_timeouts import GatherTimeoutTuner, estimate_prompt_seconds
+
+load_dotenv()
 
 app = Flask(__name__)
 
+# Spoken menu keywords -> destination ("split_speech_result" conditions)
+MENU = {
+    'sales': "15555551234",
+    'support': "15555555678",
+}
+# DTMF menu ("split_key_press" conditions)
+KEYS = {
+    '1': MENU['sales'],
+    '2': MENU['support'],
+}
+
+# Per-call early-routing state, so a late partial or the final result doesn't dial twice.
+# Once redirected the Gather action usually never fires, so keep this bounded.
+MAX_TRACKED_CALLS = 1000
+call_state = OrderedDict()
+# Flask serves partials on several threads; the check-and-mark must be atomic
+state_lock = threading.Lock()
+# Upper bound on how long /handle-input waits for an in-flight early redirect
+REDIRECT_WAIT_SECONDS = 5
+
+def new_state():
+    # 'handled' is set once /handle-input arrives, after which partials no longer redirect;
+    # 'done' is set when an early redirect's REST update has returned
+    return {'last_intent': None, 'target': None, 'confirmed': False,
+            'handled': False, 'done': threading.Event()}
+
+def track_call(call_sid):
+    """Return the routing state for a call; call with state_lock held"""
+    state = call_state.get(call_sid)
+    if state is None:
+        state = call_state[call_sid] = new_state()
+        while len(call_state) > MAX_TRACKED_CALLS:
+            call_state.popitem(last=False)
+    return state
+
+# Learns the menu Gather timeout from how long callers take to respond
+gather_tuner = GatherTimeoutTuner(log_path=os.environ.get("GATHER_TIMINGS_LOG"))
+MENU_PROMPT = "Hello, how can we direct your call? Press 1 for sales, or say sales. To reach support, press 2 or say support."
+# Estimated from the text so only the silence after the prompt is timed. It's a
+# guess at the TTS rate: if too long, callers who barge in are clamped to 0s and
+# pull the learned timeout down; if too short, every sample is inflated.
+MENU_PROMPT_SECONDS = estimate_prompt_seconds(MENU_PROMPT)
+
+def get_client():
+    account_sid = os.environ.get("TWILIO_ACCOUNT_SID")
+    auth_token = os.environ.get("TWILIO_AUTH_TOKEN")
+    if not account_sid or not auth_token:
+        return None
+    return Client(account_sid, auth_token)
+
+def match_intent(speech):
+    """Strict match for partials: the menu target if exactly one keyword is heard as a word"""
+    words = set(re.findall(r"[a-z]+", speech.lower()))
+    matches = [target for keyword, target in MENU.items() if keyword in words]
+    return matches[0] if len(matches) == 1 else None
+
+def match_speech(speech):
+    """Route the final SpeechResult (split_speech_result): first keyword found, sales before support"""
+    speech = speech.lower()
+    for keyword, target in MENU.items():
+        if keyword in speech:
+            return target
+    return None
+
+def connect(resp, target_number):
+    """Say where the caller is going and dial the target (connect_call_to_* states)"""
+    resp.say(f"Connecting you to { 'Sales' if target_number == MENU['sales'] else 'Support' }.")
+    resp.dial(target_number)
+    return resp
+
 @app.route("/answer", methods=['GET', 'POST'])
 def answer_call():
     """Start the IVR flow (gather_input state)"""
     resp = VoiceResponse()
     
     # "gather_input" state equivalent
+    timeout = gather_tuner.timeout_for('answer', 'menu', default=5)
+    # Partial results stream to /partial-input so we can route before end-of-utterance;
+    # speechTimeout=auto ends the utterance on natural pauses instead of a fixed silence
     gather = Gather(
         input='dtmf speech',
-        timeout=5,
+        timeout=timeout,
+        speechTimeout='auto',
+        partialResultCallback='/partial-input',
+        hints=', '.join(MENU),
         numDigits=1,
         action='/handle-input',
         loop=1,
         language='en'
     )
-    gather.say("Hello, how can we direct your call? Press 1 for sales, or say sales. To reach support, press 2 or say support.", voice='alice')
+    gather.say(MENU_PROMPT, voice='alice')
     
     resp.append(gather)
     
+    call_sid = request.values.get('CallSid')
+    if call_sid:
+        # A fresh Gather: don't carry a partial hypothesis over from the last attempt
+        with state_lock:
+            state = call_state.get(call_sid)
+            if state and not state['target']:
+                call_state[call_sid] = new_state()
+        # Still pending means the last menu Gather timed out with no input
+        gather_tuner.expire(call_sid)
+        gather_tuner.start(call_sid, 'answer', 'menu', timeout, prompt_seconds=MENU_PROMPT_SECONDS)
+    
     # If no input, loop connection or hangup (JSON implies simple timeout, we'll redirect to start)
     resp.redirect('/answer')
     
     return str(resp)
 
+@app.route("/partial-input", methods=['POST'])
+def partial_input():
+    """Redirect the live call as soon as a partial transcript is unambiguous"""
+    call_sid = request.values.get('CallSid')
+    # The first partial is the caller's first input; later ones are no-ops
+    gather_tuner.finish(call_sid)
+    stable = request.values.get('StableSpeechResult', '')
+    unstable = request.values.get('UnstableSpeechResult', '')
+
+    client = get_client()
+    if not call_sid or client is None:
+        # No REST credentials: fall back to routing on the final SpeechResult
+        return '', 204
+
+    with state_lock:
+        state = track_call(call_sid)
+        if state['target'] or state['handled']:
+            return '', 204
+
+        # Only act on what the recognizer won't revise: a keyword in the stable
+        # transcript, or the same intent in two consecutive partial hypotheses
+        target_number = match_intent(stable)
+        partial_intent = match_intent(' '.join([stable, unstable]))
+        if target_number is None and partial_intent and partial_intent == state['last_intent']:
+            target_number = partial_intent
+        state['last_intent'] = partial_intent
+
+        if target_number is None:
+            return '', 204
+        state['target'] = target_number
+
+    try:
+        client.calls(call_sid).update(twiml=str(connect(VoiceResponse(), target_number)))
+    except Exception as e:
+        print(f"Early routing failed for {call_sid}: {e}")
+        with state_lock:
+            state['target'] = None
+    else:
+        with state_lock:
+            state['confirmed'] = True
+    finally:
+        state['done'].set()
+
+    return '', 204
+
 @app.route("/handle-input", methods=['POST'])
 def handle_input():
     """Handle the split_key_press and split_speech_result logic"""
     resp = VoiceResponse()
     
     # Get input
+    call_sid = request.values.get('CallSid')
     digits = request.values.get('Digits', '')
-    speech = request.values.get('SpeechResult', '').lower()
-    
-    target_number = None
+    speech = request.values.get('SpeechResult', '')
+    gather_tuner.finish(call_sid)
     
-    # "split_key_press" logic
-    if digits == '1':
-        target_number = "15555551234"
-    elif digits == '2':
-        target_number = "15555555678"
-        
-    # "split_speech_result" logic
-    elif "sales" in speech:
-         target_number = "15555551234"
-    elif "support" in speech:
-         target_number = "15555555678"
+    with state_lock:
+        state = track_call(call_sid) if call_sid else new_state()
+        # No further early redirects for this Gather
+        state['handled'] = True
+        routed = state['target'] is not None
+
+    if routed:
+        # A partial already started redirecting: wait for its update to return rather
+        # than dialing here too, so the target is only dialed once
+        state['done'].wait(REDIRECT_WAIT_SECONDS)
+        with state_lock:
+            confirmed, routed_target = state['confirmed'], state['target']
+        if confirmed:
+            # The live call is already running the redirected Dial
+            return str(resp)
+        if routed_target:
+            # Update still hasn't returned; connect from here instead of hanging up
+            connect(resp, routed_target)
+            return str(resp)
+        # Update failed: fall through and route on the final result
+
+    target_number = KEYS.get(digits) or match_speech(speech)
          
     if target_number:
-        # "connect_call_to_..." logic
-        resp.say(f"Connecting you to { 'Sales' if '1234' in target_number else 'Support' }.")
-        resp.dial(target_number)
+        connect(resp, target_number)
     else:
         # "noMatch" -> Loop back
         resp.say("Sorry, I didn't catch that.")
@@ -0,0 +1,336 @@
+import os
+import sys
+import json
+import math
+import time
+import threading
+from collections import deque, OrderedDict
+
+# Bounds on any emitted Gather timeout (seconds)
+MIN_TIMEOUT = 2
+MAX_TIMEOUT = 10
+# Twilio's own Gather default, used until a step has enough observations
+DEFAULT_TIMEOUT = 5
+# Rolling window of recent response times kept per flow/step
+WINDOW_SIZE = 200
+MIN_SAMPLES = 20
+# Percentile of callers we want to finish before the timeout fires, plus slack
+PERCENTILE = 90
+PAD_SECONDS = 1.0
+# How far above the default timeout we'll probe for slow callers, and how many
+# Gathers a probe gets to turn timed-out callers into answers before it stops
+MAX_PROBE_SECONDS = 2
+PROBE_BUDGET = 20
+# Gathers started but not yet answered; bounded since many calls hang up mid-prompt
+MAX_PENDING = 1000
+# The log is rewritten down to the in-memory windows once it is this many times larger
+LOG_COMPACT_FACTOR = 2
+# Typical TTS speaking rate, used to estimate how long a prompt plays
+WORDS_PER_SECOND = 2.5
+# Prompt length charged per replay in the offline evaluation when a session doesn't say
+DEFAULT_PROMPT_SECONDS = 6
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a non-empty list of (seconds, censored) samples.
+
+    A censored sample only says the caller hadn't answered by that time, so if
+    the percentile lands on one the true value is at least that: it is returned
+    flagged, and the caller should not shrink the timeout below it.
+    """
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def estimate_prompt_seconds(text, words_per_second=WORDS_PER_SECOND):
+    """Rough playback length of a <Say> prompt.
+
+    Only an estimate: if it runs long, callers who barge in are clamped to 0s
+    and pull the percentile down; if it runs short, every sample is inflated.
+    """
+    return len(text.split()) / words_per_second
+
+
+class GatherTimeoutTuner:
+    """Learns per-step Gather timeouts from observed caller response times.
+
+    Each flow/step keeps a bounded window of recent time-to-first-input samples;
+    the next call's timeout is the chosen percentile plus some padding, clamped
+    to [min_timeout, max_timeout].
+
+    A Gather that times out is only a slow caller if they answer the replayed
+    prompt; that answer is kept as a censored sample at the timeout they got.
+    Callers who never answer are counted in a separate no-input rate and don't
+    affect the timeout.
+    """
+
+    def __init__(self, min_timeout=MIN_TIMEOUT, max_timeout=MAX_TIMEOUT,
+                 window=WINDOW_SIZE, min_samples=MIN_SAMPLES,
+                 pct=PERCENTILE, pad=PAD_SECONDS, probe_limit=MAX_PROBE_SECONDS,
+                 probe_budget=PROBE_BUDGET, log_path=None):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.window = window
+        self.min_samples = min_samples
+        self.pct = pct
+        self.pad = pad
+        self.probe_limit = probe_limit
+        self.probe_budget = probe_budget
+        self.log_path = log_path
+        self._samples = {}
+        self._outcomes = {}
+        self._probes = {}
+        self._pending = OrderedDict()
+        self._timed_out = OrderedDict()
+        self._lock = threading.Lock()
+        # Separate from _lock so webhooks never wait on disk I/O to read timeouts
+        self._log_lock = threading.Lock()
+        self._log_lines = 0
+        if log_path:
+            self.load(log_path)
+
+    def _window(self, store, key):
+        values = store.get(key)
+        if values is None:
+            values = store[key] = deque(maxlen=self.window)
+        return values
+
+    def _add(self, flow, step, seconds, censored):
+        self._window(self._samples, (flow, step)).append((seconds, censored))
+        self._window(self._outcomes, (flow, step)).append(False)
+
+    def _add_no_input(self, flow, step):
+        self._window(self._outcomes, (flow, step)).append(True)
+
+    def record(self, flow, step, seconds, censored=False):
+        """Add one time-to-first-input sample (seconds) for a flow/step.
+
+        censored=True means the caller didn't answer within `seconds` (the
+        timeout they got) but did answer the replayed prompt.
+        """
+        with self._lock:
+            self._add(flow, step, seconds, censored)
+        self._log({'flow': flow, 'step': step, 'seconds': seconds, 'censored': censored})
+
+    def record_no_input(self, flow, step):
+        """Count a Gather whose caller never answered, even after the replay"""
+        with self._lock:
+            self._add_no_input(flow, step)
+        self._log({'flow': flow, 'step': step, 'no_input': True})
+
+    def _log(self, row):
+        if not self.log_path:
+            return
+        line = json.dumps(row) + '\n'
+        with self._log_lock:
+            with open(self.log_path, 'a') as f:
+                f.write(line)
+            self._log_lines += 1
+            if self._log_lines > LOG_COMPACT_FACTOR * self.window * max(1, len(self._outcomes)):
+                self._compact()
+
+    def _compact(self):
+        """Rewrite the log down to what the windows hold; call with _log_lock held"""
+        with self._lock:
+            rows = [{'flow': flow, 'step': step, 'seconds': seconds, 'censored': censored}
+                    for (flow, step), samples in self._samples.items()
+                    for seconds, censored in samples]
+            rows += [{'flow': flow, 'step': step, 'no_input': True}
+                     for (flow, step), outcomes in self._outcomes.items()
+                     for no_input in outcomes if no_input]
+        tmp_path = self.log_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.writelines(json.dumps(row) + '\n' for row in rows)
+        os.replace(tmp_path, self.log_path)
+        self._log_lines = len(rows)
+
+    def load(self, path):
+        """Seed the windows from a previously recorded timings log.
+
+        Streams the file so the deques bound memory, and skips malformed lines
+        such as one truncated by a crash mid-write. A log that has outgrown the
+        windows is compacted.
+        """
+        try:
+            f = open(path)
+        except FileNotFoundError:
+            return
+        lines = 0
+        with f, self._lock:
+            for line in f:
+                lines += 1
+                try:
+                    row = json.loads(line)
+                    flow, step = row['flow'], row['step']
+                    if row.get('no_input'):
+                        self._add_no_input(flow, step)
+                    else:
+                        self._add(flow, step, float(row['seconds']), bool(row.get('censored')))
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    continue
+        with self._log_lock:
+            self._log_lines = lines
+            if path == self.log_path and lines > sum(len(o) for o in self._outcomes.values()):
+                self._compact()
+
+    def start(self, call_sid, flow, step, timeout, prompt_seconds=0):
+        """Mark the moment a Gather with this timeout was served for a call.
+
+        prompt_seconds is the estimated prompt length (see
+        estimate_prompt_seconds), so the recorded sample is the silence after
+        the prompt rather than the whole step.
+        """
+        with self._lock:
+            self._pending[call_sid] = (flow, step, timeout, time.monotonic() + prompt_seconds)
+            self._pending.move_to_end(call_sid)
+            while len(self._pending) > MAX_PENDING:
+                self._pending.popitem(last=False)
+
+    def finish(self, call_sid):
+        """Record the elapsed time when the caller's first input arrives"""
+        with self._lock:
+            pending = self._pending.pop(call_sid, None)
+            timed_out = self._timed_out.pop(call_sid, None)
+        if pending is None:
+            return None
+        flow, step, _, started = pending
+        if timed_out is not None and timed_out[:2] == (flow, step):
+            # Answered the replay: a slow caller, slower than the timeout they first got
+            self.record(flow, step, timed_out[2], censored=True)
+            return None
+        seconds = max(0.0, time.monotonic() - started)
+        self.record(flow, step, seconds)
+        return seconds
+
+    def expire(self, call_sid):
+        """Note that the call's pending Gather timed out with no input.
+
+        Whether that was a slow caller or a silent one is only known once the
+        replay is answered (finish) or also times out (expire again).
+        """
+        no_input = []
+        with self._lock:
+            pending = self._pending.pop(call_sid, None)
+            if pending is None:
+                return
+            previous = self._timed_out.pop(call_sid, None)
+            if previous is not None:
+                no_input.append(previous)
+            self._timed_out[call_sid] = pending[:3]
+            while len(self._timed_out) > MAX_PENDING:
+                # Most likely hung up after a timeout without answering
+                no_input.append(self._timed_out.popitem(last=False)[1])
+        for flow, step, _ in no_input:
+            self.record_no_input(flow, step)
+
+    def no_input_rate(self, flow, step):
+        """Fraction of recent Gathers at this step that never got an answer"""
+        with self._lock:
+            outcomes = list(self._outcomes.get((flow, step), ()))
+        return sum(outcomes) / len(outcomes) if outcomes else None
+
+    def timeout_for(self, flow, step, default=DEFAULT_TIMEOUT):
+        """Timeout for the next Gather served at this step"""
+        key = (flow, step)
+        with self._lock:
+            samples = list(self._samples.get(key, ()))
+            if len(samples) < self.min_samples:
+                return default
+            seconds, censored = percentile(samples, self.pct)
+            if censored:
+                timeout = self._probe(key, samples, seconds, default)
+            else:
+                self._probes.pop(key, None)
+                timeout = math.ceil(seconds + self.pad)
+        return min(self.max_timeout, max(self.min_timeout, timeout))
+
+    def _probe(self, key, samples, level, default):
+        """The percentile is a caller slower than the timeout they got: try a bit longer.
+
+        Probing is capped at probe_limit above the default, and stops (holding
+        at the censored level) if probe_budget Gathers pass without any caller
+        answering beyond that level. Call with _lock held.
+        """
+        answered_above = sum(1 for seconds, censored in samples if not censored and seconds > level)
+        probe = self._probes.get(key)
+        if probe is None or probe['level'] != level:
+            probe = self._probes[key] = {'level': level, 'served': 0, 'answered': answered_above}
+        probe['served'] += 1
+
+        floor = math.ceil(level)
+        if probe['served'] > self.probe_budget and answered_above <= probe['answered']:
+            return floor
+        return max(floor, min(default + self.probe_limit, floor + 1))
+
+
+def evaluate(sessions, baseline=DEFAULT_TIMEOUT, prompt_seconds=DEFAULT_PROMPT_SECONDS, **tuner_options):
+    """Replay recorded sessions against the tuner and a fixed baseline timeout.
+
+    sessions is an iterable of {'flow', 'step', 'seconds'} dicts in call order,
+    with seconds=None when the caller never responded, and an optional
+    'prompt_seconds'. The two effects of a timeout are reported separately:
+
+    - silent_wait: dead air spent waiting out the timeout on callers who never
+      answer, which a shorter timeout saves;
+    - cutoff_penalty: for callers slower than the timeout, the timeout plus a
+      replay of the prompt before they answer again, which it costs.
+
+    The tuner only learns what production would see: responses within the
+    adaptive timeout, a censored sample at the timeout for callers who answer
+    the replay, and a no-input count otherwise. Recorded `seconds` carry the
+    same bias as the live prompt-length estimate they were measured against.
+    """
+    tuner = GatherTimeoutTuner(**tuner_options)
+    report = {}
+    for name in ('baseline', 'adaptive'):
+        report[name] = {'steps': 0, 'silent': 0, 'silent_wait_seconds': 0.0,
+                        'cutoffs': 0, 'cutoff_penalty_seconds': 0.0, 'total_seconds': 0.0}
+
+    for s in sessions:
+        seconds = s.get('seconds')
+        replay = s.get('prompt_seconds', prompt_seconds)
+        adaptive = tuner.timeout_for(s['flow'], s['step'], default=baseline)
+        for name, timeout in (('baseline', baseline), ('adaptive', adaptive)):
+            stats = report[name]
+            stats['steps'] += 1
+            if seconds is None:
+                stats['silent'] += 1
+                stats['silent_wait_seconds'] += timeout
+                stats['total_seconds'] += timeout
+            elif seconds > timeout:
+                # Timed out, prompt replays, then the caller answers again
+                stats['cutoffs'] += 1
+                stats['cutoff_penalty_seconds'] += timeout + replay
+                stats['total_seconds'] += timeout + replay + seconds
+            else:
+                stats['total_seconds'] += seconds
+
+        if seconds is None:
+            tuner.record_no_input(s['flow'], s['step'])
+        elif seconds <= adaptive:
+            tuner.record(s['flow'], s['step'], seconds)
+        else:
+            tuner.record(s['flow'], s['step'], adaptive, censored=True)
+
+    for stats in report.values():
+        steps = stats['steps'] or 1
+        stats['mean_seconds'] = stats['total_seconds'] / steps
+    return report
+
+
+if __name__ == "__main__":
+    # Offline evaluation: python gather_timeouts.py recorded_sessions.jsonl
+    if len(sys.argv) != 2:
+        print("Usage: python gather_timeouts.py <sessions.jsonl>")
+        exit(1)
+
+    with open(sys.argv[1]) as f:
+        sessions = [json.loads(line) for line in f if line.strip()]
+
+    report = evaluate(sessions)
+    for name, stats in report.items():
+        print(f"{name:>9}: {stats['steps']} steps, "
+              f"{stats['silent']} silent ({stats['silent_wait_seconds']:.0f}s waited), "
+              f"{stats['cutoffs']} cut off ({stats['cutoff_penalty_seconds']:.0f}s penalty), "
+              f"mean {stats['mean_seconds']:.2f}s per step")
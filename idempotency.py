@@ -0,0 +1,111 @@
+import time
+import threading
+from collections import OrderedDict
+
+# How long a completed call result is replayed for duplicate requests
+DEFAULT_TTL_SECONDS = 300
+# Upper bound on remembered keys so a retry storm can't grow memory unbounded
+DEFAULT_MAX_ENTRIES = 1024
+# Window used when the client doesn't send an Idempotency-Key header
+DEFAULT_WINDOW_SECONDS = 30
+
+
+class IdempotencyConflict(Exception):
+    """An idempotency key was reused with different request parameters"""
+
+
+class _Entry:
+    def __init__(self, fingerprint, ttl):
+        self.fingerprint = fingerprint
+        self.ttl = ttl
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.expires_at = None
+
+
+class IdempotencyCache:
+    """Bounded TTL cache of in-flight and completed outbound call results.
+
+    The first request for a key runs the call; concurrent duplicates block until
+    it finishes and replays within the TTL get the same result back instead of
+    dialing again.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def run(self, key, fn, fingerprint=None, ttl=None, wait_timeout=30):
+        """Return fn() for the first request with this key, the cached result otherwise.
+
+        Returns a (result, replayed) tuple. The TTL is counted from when the
+        first call completed, so it is a sliding window rather than a fixed
+        bucket. Raises IdempotencyConflict if the key was stored with a different
+        fingerprint. Failures are not cached, so a retry after an error dials
+        again.
+        """
+        with self._lock:
+            self._purge(time.monotonic())
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = _Entry(fingerprint, self.ttl if ttl is None else ttl)
+                self._entries[key] = entry
+                self._evict()
+            elif entry.fingerprint != fingerprint:
+                raise IdempotencyConflict(f"Idempotency key {key} was used with different parameters")
+
+        if not owner:
+            if not entry.done.wait(wait_timeout):
+                raise TimeoutError(f"Timed out waiting for in-flight request {key}")
+            if entry.error is not None:
+                raise entry.error
+            return entry.result, True
+
+        try:
+            result = fn()
+        except Exception as e:
+            entry.error = e
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            entry.done.set()
+            raise
+
+        entry.result = result
+        entry.expires_at = time.monotonic() + entry.ttl
+        entry.done.set()
+        return result, False
+
+    def _purge(self, now):
+        expired = [k for k, e in self._entries.items()
+                   if e.expires_at is not None and e.expires_at <= now]
+        for k in expired:
+            del self._entries[k]
+
+    def _evict(self):
+        # Drop the oldest completed entries first; in-flight ones must stay so
+        # their waiters still resolve to a single call
+        if len(self._entries) <= self.max_entries:
+            return
+        for k in [k for k, e in self._entries.items() if e.done.is_set()]:
+            if len(self._entries) <= self.max_entries:
+                break
+            del self._entries[k]
+
+
+def fingerprint(*params):
+    """Identify the request parameters a key was first used with"""
+    return '|'.join('' if p is None else str(p) for p in params)
+
+
+def derive_key(endpoint, to_number, flow_type=None):
+    """Build a key from the call parameters when the client didn't send one.
+
+    Run it with ttl=DEFAULT_WINDOW_SECONDS so requests for the same number and
+    flow within that long of the previous call collapse into one.
+    """
+    return f"{endpoint}:{to_number}:{flow_type or ''}"
@@ -6,6 +6,7 @@ from twilio.twiml.voice_response import VoiceResponse, Dial
 import os
 from dotenv import load_dotenv
 from flask_cors import CORS
+from idempotency import IdempotencyCache, IdempotencyConflict, DEFAULT_WINDOW_SECONDS, derive_key, fingerprint
 
 load_dotenv()
 
@@ -14,6 +15,24 @@ CORS(app)
 
 identity = 'user_browser' # The client name for the browser device
 
+# Dedupes double-clicks/retries so each one doesn't place another billable call
+call_cache = IdempotencyCache()
+
+def run_idempotent(endpoint, place_call, to_number, flow_type=None):
+    """Place the call once per Idempotency-Key header (or per to/flow_type within a short window)"""
+    params = fingerprint(to_number, flow_type)
+    key = request.headers.get('Idempotency-Key')
+    if key:
+        run_args = {'key': f"{endpoint}:{key}"}
+    else:
+        run_args = {'key': derive_key(endpoint, to_number, flow_type), 'ttl': DEFAULT_WINDOW_SECONDS}
+
+    try:
+        result, replayed = call_cache.run(fn=place_call, fingerprint=params, **run_args)
+    except IdempotencyConflict as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({**result, 'replayed': replayed}), 200
+
 @app.route('/api/token', methods=['GET'])
 def get_token():
     account_sid = os.environ.get("TWILIO_ACCOUNT_SID")
@@ -151,22 +170,26 @@ def test_ivr_flow():
             # Let's try to inject the TwiML via the 'twiml' parameter of calls.create instead of 'url'.
             # This avoids the network reachability issue!
             
-            call = client.calls.create(
-                twiml=str(resp),
-                to=to_number,
-                from_=from_number
-            )
-            return jsonify({'sid': call.sid, 'status': call.status}), 200
+            def place_call():
+                call = client.calls.create(
+                    twiml=str(resp),
+                    to=to_number,
+                    from_=from_number
+                )
+                return {'sid': call.sid, 'status': call.status}
         else:
             # PSTN Logic: Use Studio Executions API
-            execution = client.studio.v2.flows(flow_sid).executions.create(
-                to=to_number,
-                from_=from_number,
-                parameters={
-                    'flow_type': flow_type
-                }
-            )
-            return jsonify({'sid': execution.sid, 'status': execution.status}), 200
+            def place_call():
+                execution = client.studio.v2.flows(flow_sid).executions.create(
+                    to=to_number,
+                    from_=from_number,
+                    parameters={
+                        'flow_type': flow_type
+                    }
+                )
+                return {'sid': execution.sid, 'status': execution.status}
+
+        return run_idempotent('test-ivr-flow', place_call, to_number, flow_type)
 
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -205,13 +228,15 @@ def make_call():
         if not to_number:
             return jsonify({'error': 'Missing "to" phone number'}), 400
 
-        call = client.calls.create(
-            url="http://demo.twilio.com/docs/voice.xml",
-            to=to_number,
-            from_=from_number
-        )
+        def place_call():
+            call = client.calls.create(
+                url="http://demo.twilio.com/docs/voice.xml",
+                to=to_number,
+                from_=from_number
+            )
+            return {'sid': call.sid, 'status': call.status}
 
-        return jsonify({'sid': call.sid, 'status': call.status}), 200
+        return run_idempotent('make-call', place_call, to_number)
 
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -1,12 +1,14 @@
 import React, { useState } from 'react';
 import { Phone, Loader2, CheckCircle2, AlertCircle } from 'lucide-react';
 import { motion } from 'framer-motion';
+import { useIdempotencyKey } from '../hooks/useIdempotencyKey';
 import './CallControl.css';
 
 export const CallControl: React.FC = () => {
     const [phoneNumber, setPhoneNumber] = useState('+14803881245');
     const [status, setStatus] = useState<'idle' | 'calling' | 'success' | 'error'>('idle');
     const [message, setMessage] = useState('');
+    const idempotency = useIdempotencyKey();
 
     const initiateCall = async () => {
         setStatus('calling');
@@ -24,12 +26,16 @@ export const CallControl: React.FC = () => {
 
         const url = `${supabaseUrl}/functions/v1/make-call`;
 
+        // Computed before any await so a second click of a double-click shares it
+        const idempotencyKey = idempotency.keyFor({ to: phoneNumber });
+
         try {
             const response = await fetch(url, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
-                    'Authorization': `Bearer ${supabaseKey}`
+                    'Authorization': `Bearer ${supabaseKey}`,
+                    'Idempotency-Key': idempotencyKey
                 },
                 body: JSON.stringify({ to: phoneNumber })
             });
@@ -40,6 +46,7 @@ export const CallControl: React.FC = () => {
             }
 
             const data = await response.json();
+            idempotency.reset();
             setStatus('success');
             setMessage(`Call initiated! SID: ${data.sid}`);
 
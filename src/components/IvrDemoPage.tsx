@@ -3,6 +3,7 @@ import { IvrTester } from './IvrTester';
 import { PhoneKeypad } from './PhoneKeypad';
 import { IncomingCall } from './IncomingCall';
 import { motion } from 'framer-motion';
+import { useIdempotencyKey } from '../hooks/useIdempotencyKey';
 import './IvrDemoPage.css';
 
 export const IvrDemoPage: React.FC = () => {
@@ -11,6 +12,7 @@ export const IvrDemoPage: React.FC = () => {
 
     const [phoneStatus, setPhoneStatus] = useState<'idle' | 'calling' | 'connected' | 'ended'>('idle');
     const [selectedFlow, setSelectedFlow] = useState('kba');
+    const idempotency = useIdempotencyKey();
 
     const handlePhoneCall = async () => {
         setPhoneStatus('calling');
@@ -24,12 +26,16 @@ export const IvrDemoPage: React.FC = () => {
             return;
         }
 
+        // Computed before any await so a second click of a double-click shares it
+        const idempotencyKey = idempotency.keyFor({ to: 'client:user_browser', flowType: selectedFlow });
+
         try {
             const res = await fetch(`${supabaseUrl}/functions/v1/test-ivr-flow`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
-                    'Authorization': `Bearer ${supabaseKey}`
+                    'Authorization': `Bearer ${supabaseKey}`,
+                    'Idempotency-Key': idempotencyKey
                 },
                 body: JSON.stringify({
                     to: 'client:user_browser',
@@ -41,6 +47,7 @@ export const IvrDemoPage: React.FC = () => {
                 throw new Error(`API Error: ${res.status}`);
             }
 
+            idempotency.reset();
             await res.json();
             setTimeout(() => setPhoneStatus('connected'), 2000);
 
@@ -1,6 +1,7 @@
 import React, { useState } from 'react';
 import { Play, Loader2, PhoneForwarded } from 'lucide-react';
 import { motion } from 'framer-motion';
+import { useIdempotencyKey } from '../hooks/useIdempotencyKey';
 import './IvrTester.css';
 
 export const IvrTester: React.FC = () => {
@@ -8,6 +9,7 @@ export const IvrTester: React.FC = () => {
     const [useSoftphone, setUseSoftphone] = useState(true);
     const [status, setStatus] = useState<'idle' | 'calling' | 'success' | 'error'>('idle');
     const [message, setMessage] = useState('');
+    const idempotency = useIdempotencyKey();
 
     const triggerFlow = async () => {
         setStatus('calling');
@@ -15,11 +17,15 @@ export const IvrTester: React.FC = () => {
 
         const target = useSoftphone ? 'client:user_browser' : phoneNumber;
 
+        // Computed before any await so a second click of a double-click shares it
+        const idempotencyKey = idempotency.keyFor({ to: target });
+
         try {
             const response = await fetch('/api/test-ivr-flow', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    'Idempotency-Key': idempotencyKey,
                 },
                 body: JSON.stringify({ to: target })
             });
@@ -30,6 +36,7 @@ export const IvrTester: React.FC = () => {
             }
 
             const data = await response.json();
+            idempotency.reset();
             setStatus('success');
             setMessage(`Flow Triggered! Call SID: ${data.sid}`);
 
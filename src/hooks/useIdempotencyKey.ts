@@ -0,0 +1,21 @@
+import { useRef } from 'react';
+
+// One Idempotency-Key per user action: a double-click or retry of the same call
+// reuses it, while changed inputs or a completed call start a fresh one.
+export const useIdempotencyKey = () => {
+    const current = useRef<{ key: string; params: string } | null>(null);
+
+    const keyFor = (params: unknown) => {
+        const serialized = JSON.stringify(params);
+        if (current.current?.params !== serialized) {
+            current.current = { key: crypto.randomUUID(), params: serialized };
+        }
+        return current.current.key;
+    };
+
+    const reset = () => {
+        current.current = null;
+    };
+
+    return { keyFor, reset };
+};
@@ -0,0 +1,54 @@
+// Best-effort dedupe of retries/double-clicks. Entries only live as long as this
+// isolate, so duplicates that land on a different instance can still dial twice.
+export const IDEMPOTENCY_TTL_MS = 5 * 60 * 1000;
+// Window used when the client doesn't send an Idempotency-Key header
+export const DERIVED_WINDOW_MS = 30 * 1000;
+const MAX_IDEMPOTENCY_ENTRIES = 1024;
+
+export type CallResult = { sid: string; status: string };
+type CallEntry = { fingerprint: string; result: Promise<CallResult>; expiresAt?: number };
+
+const callCache = new Map<string, CallEntry>();
+
+export class IdempotencyConflict extends Error {}
+
+export async function runIdempotent(
+  key: string,
+  fingerprint: string,
+  ttlMs: number,
+  placeCall: () => Promise<CallResult>,
+): Promise<CallResult & { replayed: boolean }> {
+  const now = Date.now();
+  for (const [k, e] of callCache) {
+    if (e.expiresAt !== undefined && e.expiresAt <= now) callCache.delete(k);
+  }
+
+  const existing = callCache.get(key);
+  if (existing) {
+    if (existing.fingerprint !== fingerprint) {
+      throw new IdempotencyConflict(`Idempotency key ${key} was used with different parameters`);
+    }
+    return { ...(await existing.result), replayed: true };
+  }
+
+  const entry: CallEntry = { fingerprint, result: placeCall() };
+  callCache.set(key, entry);
+  if (callCache.size > MAX_IDEMPOTENCY_ENTRIES) {
+    // Oldest first; in-flight entries stay so their waiters resolve to one call
+    for (const [k, e] of callCache) {
+      if (callCache.size <= MAX_IDEMPOTENCY_ENTRIES) break;
+      if (e.expiresAt !== undefined) callCache.delete(k);
+    }
+  }
+
+  try {
+    const result = await entry.result;
+    // Counted from completion, so it's a sliding window rather than a fixed bucket
+    entry.expiresAt = Date.now() + ttlMs;
+    return { ...result, replayed: false };
+  } catch (error) {
+    // Failures aren't cached, so a retry after an error dials again
+    if (callCache.get(key) === entry) callCache.delete(key);
+    throw error;
+  }
+}
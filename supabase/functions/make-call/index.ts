@@ -1,9 +1,16 @@
 import "jsr:@supabase/functions-js/edge-runtime.d.ts";
+import {
+  DERIVED_WINDOW_MS,
+  IDEMPOTENCY_TTL_MS,
+  IdempotencyConflict,
+  runIdempotent,
+  type CallResult,
+} from "../_shared/idempotency.ts";
 
 const corsHeaders = {
   "Access-Control-Allow-Origin": "*",
   "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-  "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Client-Info, Apikey",
+  "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Client-Info, Apikey, Idempotency-Key",
 };
 
 Deno.serve(async (req: Request) => {
@@ -41,39 +48,56 @@ Deno.serve(async (req: Request) => {
       );
     }
 
-    const auth = btoa(`${accountSid}:${authToken}`);
-    const params = new URLSearchParams();
-    params.append("To", to);
-    params.append("From", fromNumber);
-    params.append("Url", "http://demo.twilio.com/docs/voice.xml");
+    const placeCall = async (): Promise<CallResult> => {
+      const auth = btoa(`${accountSid}:${authToken}`);
+      const params = new URLSearchParams();
+      params.append("To", to);
+      params.append("From", fromNumber);
+      params.append("Url", "http://demo.twilio.com/docs/voice.xml");
 
-    const response = await fetch(
-      `https://api.twilio.com/2010-04-01/Accounts/${accountSid}/Calls.json`,
-      {
-        method: "POST",
-        headers: {
-          Authorization: `Basic ${auth}`,
-          "Content-Type": "application/x-www-form-urlencoded",
-        },
-        body: params,
+      const response = await fetch(
+        `https://api.twilio.com/2010-04-01/Accounts/${accountSid}/Calls.json`,
+        {
+          method: "POST",
+          headers: {
+            Authorization: `Basic ${auth}`,
+            "Content-Type": "application/x-www-form-urlencoded",
+          },
+          body: params,
+        }
+      );
+
+      if (!response.ok) {
+        const errorText = await response.text();
+        throw new Error(`Twilio API error: ${errorText}`);
       }
-    );
 
-    if (!response.ok) {
-      const errorText = await response.text();
-      throw new Error(`Twilio API error: ${errorText}`);
-    }
+      const data = await response.json();
+      return { sid: data.sid, status: data.status };
+    };
 
-    const data = await response.json();
+    const idempotencyKey = req.headers.get("Idempotency-Key");
+    const key = idempotencyKey ? `make-call:${idempotencyKey}` : `make-call:${to}`;
+    const ttlMs = idempotencyKey ? IDEMPOTENCY_TTL_MS : DERIVED_WINDOW_MS;
 
+    const result = await runIdempotent(key, to, ttlMs, placeCall);
     return new Response(
-      JSON.stringify({ sid: data.sid, status: data.status }),
+      JSON.stringify(result),
       {
         status: 200,
         headers: { ...corsHeaders, "Content-Type": "application/json" },
       }
     );
   } catch (error) {
+    if (error instanceof IdempotencyConflict) {
+      return new Response(
+        JSON.stringify({ error: error.message }),
+        {
+          status: 409,
+          headers: { ...corsHeaders, "Content-Type": "application/json" },
+        }
+      );
+    }
     console.error("Error making call:", error);
     return new Response(
       JSON.stringify({ error: error.message }),
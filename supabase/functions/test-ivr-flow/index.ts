@@ -1,9 +1,16 @@
 import "jsr:@supabase/functions-js/edge-runtime.d.ts";
+import {
+  DERIVED_WINDOW_MS,
+  IDEMPOTENCY_TTL_MS,
+  IdempotencyConflict,
+  runIdempotent,
+  type CallResult,
+} from "../_shared/idempotency.ts";
 
 const corsHeaders = {
   "Access-Control-Allow-Origin": "*",
   "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-  "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Client-Info, Apikey",
+  "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Client-Info, Apikey, Idempotency-Key",
 };
 
 Deno.serve(async (req: Request) => {
@@ -44,32 +51,33 @@ Deno.serve(async (req: Request) => {
 
     const auth = btoa(`${accountSid}:${authToken}`);
 
-    if (to.includes("client:")) {
-      let twiml = "";
+    const placeCall = async (): Promise<CallResult> => {
+      if (to.includes("client:")) {
+        let twiml = "";
 
-      switch (flowType) {
-        case 'kba':
-          twiml = `<?xml version="1.0" encoding="UTF-8"?>
+        switch (flowType) {
+          case 'kba':
+            twiml = `<?xml version="1.0" encoding="UTF-8"?>
 <Response>
   <Gather numDigits="4" action="/api/demo/kba-zip" method="POST">
     <Say>Welcome to Basic KBA Auth. Please enter your 4 digit Account ID.</Say>
   </Gather>
   <Redirect>/api/voice</Redirect>
 </Response>`;
-          break;
+            break;
 
-        case 'pin':
-          twiml = `<?xml version="1.0" encoding="UTF-8"?>
+          case 'pin':
+            twiml = `<?xml version="1.0" encoding="UTF-8"?>
 <Response>
   <Gather numDigits="4" action="/api/demo/pin-check" method="POST">
     <Say>Welcome to PIN Authentication. Please enter your 4 digit PIN. Try 1 2 3 4.</Say>
   </Gather>
   <Redirect>/api/voice</Redirect>
 </Response>`;
-          break;
+            break;
 
-        case 'otp':
-          twiml = `<?xml version="1.0" encoding="UTF-8"?>
+          case 'otp':
+            twiml = `<?xml version="1.0" encoding="UTF-8"?>
 <Response>
   <Say>Welcome to ID plus OTP. We are sending a code to your device.</Say>
   <Pause length="2"/>
@@ -78,30 +86,30 @@ Deno.serve(async (req: Request) => {
   </Gather>
   <Redirect>/api/voice</Redirect>
 </Response>`;
-          break;
+            break;
 
-        case 'voice':
-          twiml = `<?xml version="1.0" encoding="UTF-8"?>
+          case 'voice':
+            twiml = `<?xml version="1.0" encoding="UTF-8"?>
 <Response>
   <Gather input="speech" action="/api/demo/voice-analyze" method="POST" timeout="4">
     <Say>Welcome to Voice Biometrics. Please say: My Voice is My Password.</Say>
   </Gather>
   <Redirect>/api/voice</Redirect>
 </Response>`;
-          break;
+            break;
 
-        case 'mfa':
-          twiml = `<?xml version="1.0" encoding="UTF-8"?>
+          case 'mfa':
+            twiml = `<?xml version="1.0" encoding="UTF-8"?>
 <Response>
   <Gather numDigits="4" action="/api/demo/mfa-step2" method="POST">
     <Say>Welcome to Full MFA. Step 1: Please enter your 4 digit PIN.</Say>
   </Gather>
   <Redirect>/api/voice</Redirect>
 </Response>`;
-          break;
+            break;
 
-        case 'trustid_short':
-          twiml = `<?xml version="1.0" encoding="UTF-8"?>
+          case 'trustid_short':
+            twiml = `<?xml version="1.0" encoding="UTF-8"?>
 <Response>
   <Say>Trust I.D. Analyzing Call Signal...</Say>
   <Pause length="1"/>
@@ -111,10 +119,10 @@ Deno.serve(async (req: Request) => {
   </Gather>
   <Redirect>/api/voice</Redirect>
 </Response>`;
-          break;
+            break;
 
-        case 'trustid_selfservice':
-          twiml = `<?xml version="1.0" encoding="UTF-8"?>
+          case 'trustid_selfservice':
+            twiml = `<?xml version="1.0" encoding="UTF-8"?>
 <Response>
   <Say>Trust I.D. Analyzing Call Signal...</Say>
   <Pause length="1"/>
@@ -124,10 +132,10 @@ Deno.serve(async (req: Request) => {
   </Gather>
   <Redirect>/api/voice</Redirect>
 </Response>`;
-          break;
+            break;
 
-        case 'trustid_routing':
-          twiml = `<?xml version="1.0" encoding="UTF-8"?>
+          case 'trustid_routing':
+            twiml = `<?xml version="1.0" encoding="UTF-8"?>
 <Response>
   <Say>Trust I.D. Analyzing Call Signal...</Say>
   <Pause length="1"/>
@@ -136,78 +144,89 @@ Deno.serve(async (req: Request) => {
   <Say>For your security, we are routing this call to a Fraud Prevention Specialist for manual identity verification. Please hold.</Say>
   <Play>http://com.twilio.sounds.music.s3.amazonaws.com/MARKOVICHAMP-Borghestral.mp3</Play>
 </Response>`;
-          break;
+            break;
 
-        default:
-          twiml = `<?xml version="1.0" encoding="UTF-8"?>
+          default:
+            twiml = `<?xml version="1.0" encoding="UTF-8"?>
 <Response>
   <Say>Welcome to the IVR Demo. Please select a scenario.</Say>
 </Response>`;
-      }
+        }
 
-      const params = new URLSearchParams();
-      params.append("To", to);
-      params.append("From", fromNumber);
-      params.append("Twiml", twiml);
+        const params = new URLSearchParams();
+        params.append("To", to);
+        params.append("From", fromNumber);
+        params.append("Twiml", twiml);
+
+        const response = await fetch(
+          `https://api.twilio.com/2010-04-01/Accounts/${accountSid}/Calls.json`,
+          {
+            method: "POST",
+            headers: {
+              Authorization: `Basic ${auth}`,
+              "Content-Type": "application/x-www-form-urlencoded",
+            },
+            body: params,
+          }
+        );
+
+        if (!response.ok) {
+          const errorText = await response.text();
+          throw new Error(`Twilio API error: ${errorText}`);
+        }
 
-      const response = await fetch(
-        `https://api.twilio.com/2010-04-01/Accounts/${accountSid}/Calls.json`,
-        {
-          method: "POST",
-          headers: {
-            Authorization: `Basic ${auth}`,
-            "Content-Type": "application/x-www-form-urlencoded",
-          },
-          body: params,
+        const data = await response.json();
+        return { sid: data.sid, status: data.status };
+      } else {
+        const params = new URLSearchParams();
+        params.append("To", to);
+        params.append("From", fromNumber);
+        params.append("Parameters", JSON.stringify({ flow_type: flowType }));
+
+        const response = await fetch(
+          `https://studio.twilio.com/v2/Flows/${flowSid}/Executions`,
+          {
+            method: "POST",
+            headers: {
+              Authorization: `Basic ${auth}`,
+              "Content-Type": "application/x-www-form-urlencoded",
+            },
+            body: params,
+          }
+        );
+
+        if (!response.ok) {
+          const errorText = await response.text();
+          throw new Error(`Twilio Studio API error: ${errorText}`);
         }
-      );
 
-      if (!response.ok) {
-        const errorText = await response.text();
-        throw new Error(`Twilio API error: ${errorText}`);
+        const data = await response.json();
+        return { sid: data.sid, status: data.status };
       }
+    };
 
-      const data = await response.json();
-      return new Response(
-        JSON.stringify({ sid: data.sid, status: data.status }),
-        {
-          status: 200,
-          headers: { ...corsHeaders, "Content-Type": "application/json" },
-        }
-      );
-    } else {
-      const params = new URLSearchParams();
-      params.append("To", to);
-      params.append("From", fromNumber);
-      params.append("Parameters", JSON.stringify({ flow_type: flowType }));
-
-      const response = await fetch(
-        `https://studio.twilio.com/v2/Flows/${flowSid}/Executions`,
-        {
-          method: "POST",
-          headers: {
-            Authorization: `Basic ${auth}`,
-            "Content-Type": "application/x-www-form-urlencoded",
-          },
-          body: params,
-        }
-      );
+    const idempotencyKey = req.headers.get("Idempotency-Key");
+    const key = idempotencyKey ? `test-ivr-flow:${idempotencyKey}` : `test-ivr-flow:${to}:${flowType}`;
+    const ttlMs = idempotencyKey ? IDEMPOTENCY_TTL_MS : DERIVED_WINDOW_MS;
 
-      if (!response.ok) {
-        const errorText = await response.text();
-        throw new Error(`Twilio Studio API error: ${errorText}`);
+    const result = await runIdempotent(key, `${to}|${flowType}`, ttlMs, placeCall);
+    return new Response(
+      JSON.stringify(result),
+      {
+        status: 200,
+        headers: { ...corsHeaders, "Content-Type": "application/json" },
       }
-
-      const data = await response.json();
+    );
+  } catch (error) {
+    if (error instanceof IdempotencyConflict) {
       return new Response(
-        JSON.stringify({ sid: data.sid, status: data.status }),
+        JSON.stringify({ error: error.message }),
         {
-          status: 200,
+          status: 409,
           headers: { ...corsHeaders, "Content-Type": "application/json" },
         }
       );
     }
-  } catch (error) {
     console.error("Error testing IVR flow:", error);
     return new Response(
       JSON.stringify({ error: error.message }),